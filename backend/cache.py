@@ -0,0 +1,146 @@
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Optional
+
+import bson
+
+from database import settings
+
+logger = logging.getLogger(__name__)
+
+class MemoryLRU:
+    """Byte-bounded LRU of encoded cache entries."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: OrderedDict[str, bytes] = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self.entries[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+class NoteCache:
+    """Per-user read-through cache for note documents and list results.
+
+    Every key embeds the user's current version; bumping the version on a write
+    makes all of that user's earlier entries unreachable, and the LRU ages them out.
+    With CACHE_REDIS_URL set, versions and entries are shared through Redis so that
+    all workers see the same invalidations; the in-process LRU stays in front of it.
+    """
+
+    def __init__(self, max_bytes: int, redis_url: str = "", ttl_seconds: int = 300):
+        self.local = MemoryLRU(max_bytes)
+        self.versions: dict[str, int] = {}
+        self.ttl_seconds = ttl_seconds
+        self.redis = None
+        self.redis_errors: tuple = ()
+        # Users whose invalidation could not reach Redis; retried before the next read.
+        self.pending: set[str] = set()
+        if redis_url:
+            try:
+                import redis.asyncio as redis_asyncio
+                from redis.exceptions import RedisError
+            except ImportError:
+                logger.error("CACHE_REDIS_URL is set but the redis package is not installed; using the in-process cache only.")
+            else:
+                self.redis = redis_asyncio.from_url(redis_url)
+                self.redis_errors = (RedisError, OSError)
+
+    async def version(self, user_id: str) -> Optional[int]:
+        """Current version for the user, or None when the cache must be bypassed."""
+        if self.redis is None:
+            return self.versions.get(user_id, 0)
+        key = f"snapnote:ver:{user_id}"
+        try:
+            for pending_user in list(self.pending):
+                await self._bump(pending_user)
+                self.pending.discard(pending_user)
+            value = await self.redis.get(key)
+            if value is None:
+                # Seed from the clock so a lost counter never reuses an old version.
+                await self.redis.set(key, time.time_ns(), nx=True)
+                value = await self.redis.get(key)
+        except self.redis_errors as e:
+            logger.warning(f"Cache version lookup failed, reading from the database: {e}")
+            return None
+        return int(value)
+
+    async def _bump(self, user_id: str):
+        key = f"snapnote:ver:{user_id}"
+        if await self.redis.incr(key) == 1:
+            await self.redis.set(key, time.time_ns())
+
+    async def invalidate(self, user_id: str):
+        if self.redis is None:
+            self.versions[user_id] = self.versions.get(user_id, 0) + 1
+            return
+        try:
+            await self._bump(user_id)
+        except self.redis_errors as e:
+            self.pending.add(user_id)
+            logger.error(f"Cache invalidation failed for user {user_id}, will retry: {e}")
+
+    async def get(self, key: Optional[str]) -> Optional[Any]:
+        if key is None:
+            return None
+        raw = self.local.get(key)
+        if raw is None and self.redis is not None:
+            try:
+                raw = await self.redis.get(f"snapnote:cache:{key}")
+            except self.redis_errors as e:
+                logger.warning(f"Cache read failed, reading from the database: {e}")
+                return None
+            if raw is not None:
+                self.local.set(key, raw)
+        if raw is None:
+            return None
+        return bson.decode(raw)["v"]
+
+    async def set(self, key: Optional[str], value: Any):
+        if key is None:
+            return
+        raw = bson.encode({"v": value})
+        self.local.set(key, raw)
+        if self.redis is not None:
+            try:
+                await self.redis.set(f"snapnote:cache:{key}", raw, ex=self.ttl_seconds)
+            except self.redis_errors as e:
+                logger.warning(f"Cache write failed: {e}")
+
+def note_key(user_id: str, version: Optional[int], note_id: str) -> Optional[str]:
+    if version is None:
+        return None
+    return f"note:{user_id}:{version}:{note_id}"
+
+def list_key(user_id: str, version: Optional[int], **params) -> Optional[str]:
+    if version is None:
+        return None
+    if params.get("tags") is not None:
+        params["tags"] = sorted({t.strip() for t in params["tags"].split(",") if t.strip()}) or None
+    if params.get("search") is not None:
+        params["search"] = params["search"] or None
+    normalized = repr(sorted(params.items())).encode()
+    return f"list:{user_id}:{version}:{hashlib.sha1(normalized).hexdigest()}"
+
+note_cache = NoteCache(
+    max_bytes=settings.CACHE_MAX_BYTES,
+    redis_url=settings.CACHE_REDIS_URL,
+    ttl_seconds=settings.CACHE_TTL_SECONDS,
+)
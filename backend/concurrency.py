@@ -0,0 +1,220 @@
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import json
+from typing import Optional
+
+HEALTH, READ, WRITE, BULK, AUTH = range(5)
+PRIORITY_NAMES = {HEALTH: "health", READ: "read", WRITE: "write", BULK: "bulk", AUTH: "auth"}
+
+def classify(method: str, path: str) -> int:
+    if path in ("/", "/healthz", "/metrics") or method == "OPTIONS":
+        return HEALTH
+    if path.startswith("/auth"):
+        return AUTH
+    if (
+        path.startswith("/sync")
+        or path == "/notes/duplicates"
+        or path == "/notes/archive/clear"
+        or "/attachments" in path
+    ):
+        return BULK
+    if method in ("GET", "HEAD"):
+        return READ
+    return WRITE
+
+def is_streaming(method: str, path: str) -> bool:
+    """Attachment transfers whose duration depends on the client, not on server load."""
+    return (
+        (method == "POST" and path.endswith("/attachments"))
+        or (method in ("GET", "HEAD") and "/attachments/" in path)
+    )
+
+class Shed(Exception):
+    pass
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit with a bounded, priority-ordered wait queue.
+
+    While the limit is saturated it grows by roughly one per round of requests that
+    finish under the latency target, and shrinks by `backoff` when a request is
+    slow or fails, at most once per target interval. Below the limit, slow requests
+    say nothing about overload and leave it alone.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        target_latency: float,
+        max_queue: int,
+        queue_timeout: float,
+        backoff: float = 0.9,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.backoff = backoff
+        self.in_flight = 0
+        self.queue: list[tuple[int, int, asyncio.Future]] = []
+        self.counter = itertools.count()
+        self.last_decrease = 0.0
+        self.avg_latency = target_latency
+        self.shed = {name: 0 for name in PRIORITY_NAMES.values()}
+
+    def prune(self):
+        """Drop waiters that already timed out, were cancelled or were displaced."""
+        live = [entry for entry in self.queue if not entry[2].done()]
+        if len(live) != len(self.queue):
+            self.queue = live
+            heapq.heapify(self.queue)
+
+    def queue_depth(self) -> int:
+        self.prune()
+        return len(self.queue)
+
+    def retry_after(self) -> int:
+        backlog = self.queue_depth() + self.in_flight
+        return max(1, min(30, math.ceil(self.avg_latency * backlog / max(self.limit, 1))))
+
+    def record_shed(self, priority: int):
+        self.shed[PRIORITY_NAMES[priority]] += 1
+
+    async def acquire(self, priority: int) -> bool:
+        """Wait for a slot; returns whether the limit was saturated when the slot was granted."""
+        self.prune()
+        if self.in_flight < int(self.limit) and not self.queue:
+            self.in_flight += 1
+            return self.in_flight >= int(self.limit)
+
+        # Only live waiters are left, so displacement always frees a real slot.
+        if len(self.queue) >= self.max_queue:
+            worst = max(self.queue, key=lambda entry: (entry[0], entry[1]), default=None)
+            if worst is None or worst[0] <= priority:
+                self.record_shed(priority)
+                raise Shed()
+            # A more important request displaces the least important waiter.
+            self.queue.remove(worst)
+            heapq.heapify(self.queue)
+            worst[2].set_exception(Shed())
+            self.record_shed(worst[0])
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queue, (priority, next(self.counter), waiter))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.exception():
+                # Granted just as the timeout fired; hand the slot back.
+                self.release()
+            else:
+                waiter.cancel()
+            self.record_shed(priority)
+            raise Shed()
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled() and not waiter.exception():
+                self.release()
+            else:
+                waiter.cancel()
+            raise
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self.wake()
+
+    def wake(self):
+        while self.queue and self.in_flight < int(self.limit):
+            _, _, waiter = heapq.heappop(self.queue)
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(True)
+
+    def on_complete(self, latency: float, failed: bool, saturated: bool):
+        self.avg_latency = 0.9 * self.avg_latency + 0.1 * latency
+        now = time.monotonic()
+        if not saturated:
+            return
+        if failed or latency > self.target_latency:
+            if now - self.last_decrease >= self.target_latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self.last_decrease = now
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.wake()
+
+    def metrics(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth(),
+            "avg_latency_ms": round(self.avg_latency * 1000, 1),
+            "shed": dict(self.shed),
+            "shed_total": sum(self.shed.values()),
+        }
+
+class ConcurrencyLimitMiddleware:
+    def __init__(self, app, limiter: AdaptiveLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        priority = classify(scope["method"], scope["path"])
+        if priority == HEALTH:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            saturated = await self.limiter.acquire(priority)
+        except Shed:
+            await self.reject(send)
+            return
+
+        started = time.monotonic()
+        latency: Optional[float] = None
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal latency, status_code
+            if message["type"] == "http.response.start" and latency is None:
+                # Time to first byte, so long streamed responses don't read as overload.
+                latency = time.monotonic() - started
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Transfers hold their slot for as long as they run, but their duration
+            # is the client's, not ours, so they don't feed the limit.
+            if not is_streaming(scope["method"], scope["path"]):
+                self.limiter.on_complete(
+                    latency if latency is not None else time.monotonic() - started,
+                    status_code >= 500,
+                    saturated,
+                )
+            self.limiter.release()
+
+    async def reject(self, send):
+        body = json.dumps({"detail": "Server is overloaded, please retry"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(self.limiter.retry_after()).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -15,6 +15,17 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     ALLOWED_ORIGINS: str = "http://localhost:3000"
     RENDER: bool = False
+    SIMILARITY_CACHE_BYTES: int = 128 * 1024 * 1024
+    MAX_ATTACHMENT_BYTES: int = 25 * 1024 * 1024
+    CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    CACHE_TTL_SECONDS: int = 300
+    CACHE_REDIS_URL: str = ""
+    CONCURRENCY_INITIAL_LIMIT: int = 20
+    CONCURRENCY_MIN_LIMIT: int = 2
+    CONCURRENCY_MAX_LIMIT: int = 200
+    CONCURRENCY_TARGET_LATENCY_MS: int = 300
+    CONCURRENCY_MAX_QUEUE: int = 100
+    CONCURRENCY_QUEUE_TIMEOUT_SECONDS: float = 5.0
 
     class Config:
         env_file = ".env"
@@ -1,17 +1,34 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from database import db, settings
-from routes import auth, notes, tags, users
+from routes import attachments, auth, notes, sync, tags, users
+from sync_utils import ensure_sync_indexes
+from concurrency import AdaptiveLimiter, ConcurrencyLimitMiddleware
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     db.connect()
+    index_task = asyncio.create_task(ensure_sync_indexes())
     yield
+    index_task.cancel()
     db.close()
 
 app = FastAPI(lifespan=lifespan)
 
+limiter = AdaptiveLimiter(
+    initial_limit=settings.CONCURRENCY_INITIAL_LIMIT,
+    min_limit=settings.CONCURRENCY_MIN_LIMIT,
+    max_limit=settings.CONCURRENCY_MAX_LIMIT,
+    target_latency=settings.CONCURRENCY_TARGET_LATENCY_MS / 1000,
+    max_queue=settings.CONCURRENCY_MAX_QUEUE,
+    queue_timeout=settings.CONCURRENCY_QUEUE_TIMEOUT_SECONDS,
+)
+
+# Added before CORS so it runs inside it and shed responses still carry CORS headers
+app.add_middleware(ConcurrencyLimitMiddleware, limiter=limiter)
+
 origins = [origin.strip() for origin in settings.ALLOWED_ORIGINS.split(",")]
 
 app.add_middleware(
@@ -20,13 +37,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
 # ✅ THEN routers
 app.include_router(auth.router)
 app.include_router(notes.router)
+app.include_router(attachments.router)
 app.include_router(tags.router)
 app.include_router(users.router)
+app.include_router(sync.router)
 
 @app.get("/")
 def read_root():
@@ -39,3 +59,7 @@ async def healthz():
         return {"status": "ok", "db": "connected"}
     except Exception as e:
         return {"status": "error", "db": "disconnected", "details": str(e)}
+
+@app.get("/metrics")
+async def metrics():
+    return {"concurrency": limiter.metrics()}
@@ -64,6 +64,37 @@ class NoteResponse(NoteBase):
         arbitrary_types_allowed=True,
     )
 
+class NoteFacetCount(BaseModel):
+    value: Any
+    count: int
+
+class NoteListFacets(BaseModel):
+    items: list[NoteResponse]
+    total: int
+    tags: list[NoteFacetCount] = []
+    archived: list[NoteFacetCount] = []
+
+class RelatedNote(BaseModel):
+    note: NoteResponse
+    score: float
+
+class DuplicatePair(BaseModel):
+    note_ids: list[PyObjectId]
+    score: float
+
+class AttachmentResponse(BaseModel):
+    id: PyObjectId = Field(alias="_id")
+    note_id: PyObjectId
+    filename: str
+    content_type: str
+    length: int
+    upload_date: datetime
+
+    model_config = ConfigDict(
+        populate_by_name=True,
+        arbitrary_types_allowed=True,
+    )
+
 class UserResponse(UserBase):
     id: Optional[PyObjectId] = Field(alias="_id", default=None)
     created_at: datetime
@@ -96,4 +127,12 @@ class TagResponse(TagBase):
     model_config = ConfigDict(
         populate_by_name=True,
         arbitrary_types_allowed=True,
-    )
\ No newline at end of file
+    )
+
+class SyncResponse(BaseModel):
+    notes: list[NoteResponse] = []
+    tags: list[TagResponse] = []
+    deleted_notes: list[PyObjectId] = []
+    deleted_tags: list[PyObjectId] = []
+    token: str
+    has_more: bool = False
\ No newline at end of file
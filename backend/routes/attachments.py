@@ -0,0 +1,251 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from urllib.parse import quote
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+from database import db, settings
+from models import AttachmentResponse, UserInDB
+from auth_utils import get_current_user
+
+router = APIRouter(prefix="/notes", tags=["attachments"])
+
+BUCKET_NAME = "attachments"
+CHUNK_SIZE = 255 * 1024
+# Types browsers can render without running script; everything else downloads.
+INLINE_TYPES = {
+    "image/png", "image/jpeg", "image/gif", "image/webp", "image/avif",
+    "application/pdf", "text/plain",
+    "audio/mpeg", "audio/ogg", "audio/wav", "audio/webm",
+    "video/mp4", "video/webm", "video/ogg",
+}
+
+def get_bucket() -> AsyncIOMotorGridFSBucket:
+    return AsyncIOMotorGridFSBucket(db.get_db(), bucket_name=BUCKET_NAME, chunk_size_bytes=CHUNK_SIZE)
+
+async def delete_note_attachments(user_id: str, note_ids: list[str]):
+    if not note_ids:
+        return
+    files = db.get_db()[f"{BUCKET_NAME}.files"]
+    cursor = files.find(
+        {"metadata.user_id": user_id, "metadata.note_id": {"$in": note_ids}},
+        {"_id": 1}
+    )
+    file_ids = [f["_id"] async for f in cursor]
+    if not file_ids:
+        return
+    await db.get_db()[f"{BUCKET_NAME}.chunks"].delete_many({"files_id": {"$in": file_ids}})
+    await files.delete_many({"_id": {"$in": file_ids}})
+
+async def get_owned_note_id(note_id: str, user_id: str) -> str:
+    try:
+        obj_id = ObjectId(note_id)
+    except:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid note ID")
+
+    note = await db.get_db()["notes"].find_one({"_id": obj_id, "user_id": user_id}, {"_id": 1})
+    if not note:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Note not found")
+    return str(obj_id)
+
+async def get_owned_file(note_id: str, attachment_id: str, user_id: str) -> dict:
+    note_id = await get_owned_note_id(note_id, user_id)
+    try:
+        file_id = ObjectId(attachment_id)
+    except:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid attachment ID")
+
+    file_doc = await db.get_db()[f"{BUCKET_NAME}.files"].find_one({
+        "_id": file_id,
+        "metadata.note_id": note_id,
+        "metadata.user_id": user_id
+    })
+    if not file_doc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Attachment not found")
+    return file_doc
+
+def to_attachment_response(file_doc: dict) -> AttachmentResponse:
+    metadata = file_doc.get("metadata") or {}
+    return AttachmentResponse(
+        _id=file_doc["_id"],
+        note_id=metadata["note_id"],
+        filename=file_doc["filename"],
+        content_type=metadata.get("content_type", "application/octet-stream"),
+        length=file_doc["length"],
+        upload_date=file_doc["uploadDate"],
+    )
+
+def parse_range(header: str, length: int) -> Optional[tuple[int, int]]:
+    """Parse a single-range `bytes=` header into an inclusive (start, end) pair.
+
+    Returns None when the header should be ignored (malformed or multi-range),
+    raises 416 when the range cannot be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else length - 1
+        else:
+            suffix = int(last)
+            start = max(length - suffix, 0) if suffix else length
+            end = length - 1
+    except ValueError:
+        return None
+
+    if start >= length or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{length}"},
+        )
+    return start, min(end, length - 1)
+
+def not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+async def iter_file(grid_out, start: int, length: int):
+    try:
+        grid_out.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await grid_out.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        # MotorGridOut.close is pymongo's synchronous GridOut.close.
+        grid_out.close()
+
+@router.post("/{note_id}/attachments", response_model=AttachmentResponse, status_code=status.HTTP_201_CREATED)
+async def upload_attachment(
+    note_id: str,
+    request: Request,
+    filename: str = Query(min_length=1, max_length=255),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    note_id = await get_owned_note_id(note_id, current_user.id)
+
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > settings.MAX_ATTACHMENT_BYTES:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Attachment too large")
+
+    content_type = request.headers.get("content-type") or "application/octet-stream"
+    grid_in = get_bucket().open_upload_stream(
+        filename,
+        metadata={
+            "note_id": note_id,
+            "user_id": current_user.id,
+            "content_type": content_type,
+        },
+    )
+
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > settings.MAX_ATTACHMENT_BYTES:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Attachment too large")
+            await grid_in.write(chunk)
+    except BaseException:
+        await grid_in.abort()
+        raise
+    await grid_in.close()
+
+    file_doc = await db.get_db()[f"{BUCKET_NAME}.files"].find_one({"_id": grid_in._id})
+    return to_attachment_response(file_doc)
+
+@router.get("/{note_id}/attachments", response_model=List[AttachmentResponse])
+async def list_attachments(
+    note_id: str,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    note_id = await get_owned_note_id(note_id, current_user.id)
+    cursor = db.get_db()[f"{BUCKET_NAME}.files"].find(
+        {"metadata.note_id": note_id, "metadata.user_id": current_user.id}
+    ).sort("uploadDate", 1)
+    return [to_attachment_response(f) async for f in cursor]
+
+@router.get("/{note_id}/attachments/{attachment_id}")
+async def download_attachment(
+    note_id: str,
+    attachment_id: str,
+    request: Request,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    file_doc = await get_owned_file(note_id, attachment_id, current_user.id)
+    attachment = to_attachment_response(file_doc)
+
+    last_modified = attachment.upload_date
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # GridFS files are immutable, so the file id is a strong validator.
+    etag = f'"{attachment.id}"'
+    media_type = attachment.content_type.split(";")[0].strip().lower()
+    disposition = "inline" if media_type in INLINE_TYPES else "attachment"
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=0, must-revalidate",
+        "Content-Disposition": f"{disposition}; filename*=UTF-8''{quote(attachment.filename)}",
+        "X-Content-Type-Options": "nosniff",
+    }
+
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    length = attachment.length
+    start, end = 0, length - 1
+    status_code = status.HTTP_200_OK
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and length > 0 and (if_range is None or if_range.strip() == etag):
+        byte_range = parse_range(range_header, length)
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = status.HTTP_206_PARTIAL_CONTENT
+            headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+
+    content_length = max(end - start + 1, 0)
+    headers["Content-Length"] = str(content_length)
+    grid_out = await get_bucket().open_download_stream(file_doc["_id"])
+    return StreamingResponse(
+        iter_file(grid_out, start, content_length),
+        status_code=status_code,
+        media_type=attachment.content_type,
+        headers=headers,
+    )
+
+@router.delete("/{note_id}/attachments/{attachment_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_attachment(
+    note_id: str,
+    attachment_id: str,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    file_doc = await get_owned_file(note_id, attachment_id, current_user.id)
+    await get_bucket().delete(file_doc["_id"])
+    return None
@@ -1,11 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List, Optional
+from typing import List, Optional, Union
 from datetime import datetime, timezone
 from bson import ObjectId
 
 from database import db
-from models import NoteCreate, NoteResponse, NoteInDB, UserInDB, NoteUpdate, PyObjectId
+from models import NoteCreate, NoteResponse, NoteInDB, UserInDB, NoteUpdate, PyObjectId, NoteListFacets, NoteFacetCount, RelatedNote, DuplicatePair
 from auth_utils import get_current_user
+from similarity import similarity_index, compute_signature
+from routes.attachments import delete_note_attachments
+from cache import note_cache, note_key, list_key
+from sync_utils import reserve_changes, record_tombstones
 
 router = APIRouter(prefix="/notes", tags=["notes"])
 
@@ -19,24 +23,19 @@ async def create_note(
     note_data["created_at"] = datetime.now(timezone.utc)
     note_data["updated_at"] = datetime.now(timezone.utc)
     note_data["is_archived"] = False
+    note_data["minhash"] = await compute_signature(note.title, note.content)
 
-    new_note = await db.get_db()["notes"].insert_one(note_data)
+    async with reserve_changes(current_user.id) as change_seq:
+        note_data["change_seq"] = change_seq
+        new_note = await db.get_db()["notes"].insert_one(note_data)
+    await note_cache.invalidate(current_user.id)
     created_note = await db.get_db()["notes"].find_one({"_id": new_note.inserted_id})
+    similarity_index.note_changed(current_user.id, created_note)
     
     return NoteResponse(**created_note)
 
-@router.get("/", response_model=List[NoteResponse])
-async def list_notes(
-    limit: int = Query(default=10, ge=1),
-    archived: bool = Query(default=False),
-    search: Optional[str] = None,
-    tags: Optional[str] = Query(default=None),
-    current_user: UserInDB = Depends(get_current_user)
-):
-    filter_query = {
-        "user_id": current_user.id,
-        "is_archived": archived
-    }
+def build_notes_filter(user_id: str, search: Optional[str], tags: Optional[str]) -> dict:
+    filter_query = {"user_id": user_id}
 
     if search:
         filter_query["$or"] = [
@@ -48,9 +47,76 @@ async def list_notes(
         tag_list = [t.strip() for t in tags.split(",") if t.strip()]
         if tag_list:
             filter_query["tags"] = {"$all": tag_list}
-    
-    cursor = db.get_db()["notes"].find(filter_query).sort("updated_at", -1).limit(limit)
-    notes = await cursor.to_list(length=limit)
+
+    return filter_query
+
+async def find_notes_page(filter_query: dict, archived: bool, limit: int) -> list:
+    cursor = db.get_db()["notes"].find(
+        {**filter_query, "is_archived": archived}, {"minhash": 0}
+    ).sort("updated_at", -1).limit(limit)
+    return await cursor.to_list(length=limit)
+
+@router.get("/", response_model=Union[List[NoteResponse], NoteListFacets])
+async def list_notes(
+    limit: int = Query(default=10, ge=1),
+    archived: bool = Query(default=False),
+    search: Optional[str] = None,
+    tags: Optional[str] = Query(default=None),
+    facets: bool = Query(default=False),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    version = await note_cache.version(current_user.id)
+    cache_key = list_key(
+        current_user.id, version,
+        limit=limit, archived=archived, search=search, tags=tags, facets=facets
+    )
+    cached = await note_cache.get(cache_key)
+
+    filter_query = build_notes_filter(current_user.id, search, tags)
+
+    if facets:
+        # One pass for the counts: the archived facet ignores the archived flag so
+        # both counts come back, everything else is scoped to the current view.
+        # The page itself is read with find, since a facet returns a single
+        # document and large pages would run into the 16MB document limit.
+        pipeline = [
+            {"$match": filter_query},
+            {"$facet": {
+                "total": [
+                    {"$match": {"is_archived": archived}},
+                    {"$count": "count"},
+                ],
+                "tags": [
+                    {"$match": {"is_archived": archived}},
+                    {"$unwind": "$tags"},
+                    {"$group": {"_id": "$tags", "count": {"$sum": 1}}},
+                    {"$sort": {"count": -1, "_id": 1}},
+                ],
+                "archived": [
+                    {"$group": {"_id": "$is_archived", "count": {"$sum": 1}}},
+                    {"$sort": {"_id": 1}},
+                ],
+            }},
+        ]
+        if cached is None:
+            result = await db.get_db()["notes"].aggregate(pipeline).to_list(length=1)
+            cached = result[0] if result else {}
+            cached["items"] = await find_notes_page(filter_query, archived, limit)
+            await note_cache.set(cache_key, cached)
+        facet = cached
+        total = facet.get("total") or [{"count": 0}]
+
+        return NoteListFacets(
+            items=[NoteResponse(**note) for note in facet.get("items", [])],
+            total=total[0]["count"],
+            tags=[NoteFacetCount(value=t["_id"], count=t["count"]) for t in facet.get("tags", [])],
+            archived=[NoteFacetCount(value=a["_id"], count=a["count"]) for a in facet.get("archived", [])],
+        )
+
+    if cached is None:
+        cached = await find_notes_page(filter_query, archived, limit)
+        await note_cache.set(cache_key, cached)
+    notes = cached
     
     return [NoteResponse(**note) for note in notes]
 
@@ -58,13 +124,30 @@ async def list_notes(
 async def clear_archive(
     current_user: UserInDB = Depends(get_current_user)
 ):
-    result = await db.get_db()["notes"].delete_many({
-        "user_id": current_user.id,
-        "is_archived": True
-    })
+    archive_filter = {"user_id": current_user.id, "is_archived": True}
+    archived_oids = [n["_id"] async for n in db.get_db()["notes"].find(archive_filter, {"_id": 1})]
+    # Delete exactly the notes collected above so tombstones and attachment
+    # cleanup cover the same set, even if more notes get archived meanwhile.
+    result = await db.get_db()["notes"].delete_many({"_id": {"$in": archived_oids}, **archive_filter})
+    # A note restored in between survives the delete and must keep its attachments.
+    survivors = {n["_id"] async for n in db.get_db()["notes"].find({"_id": {"$in": archived_oids}}, {"_id": 1})}
+    archived_ids = [str(oid) for oid in archived_oids if oid not in survivors]
+    await note_cache.invalidate(current_user.id)
+    await record_tombstones("note", current_user.id, archived_ids)
+    await delete_note_attachments(current_user.id, archived_ids)
     
     return {"message": "Archive cleared", "deleted_count": result.deleted_count}
 
+@router.get("/duplicates", response_model=List[DuplicatePair])
+async def find_duplicate_notes(
+    limit: int = Query(default=20, ge=1, le=200),
+    threshold: float = Query(default=0.8, ge=0.2, le=1.0),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    index = await similarity_index.get(current_user.id)
+    pairs = index.duplicates(limit, threshold)
+    return [DuplicatePair(note_ids=[a, b], score=score) for a, b, score in pairs]
+
 @router.get("/{note_id}", response_model=NoteResponse)
 async def get_note(
     note_id: str,
@@ -75,9 +158,14 @@ async def get_note(
     except:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid note ID")
 
-    note = await db.get_db()["notes"].find_one({"_id": obj_id, "user_id": current_user.id})
-    if not note:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Note not found")
+    version = await note_cache.version(current_user.id)
+    cache_key = note_key(current_user.id, version, str(obj_id))
+    note = await note_cache.get(cache_key)
+    if note is None:
+        note = await db.get_db()["notes"].find_one({"_id": obj_id, "user_id": current_user.id}, {"minhash": 0})
+        if not note:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Note not found")
+        await note_cache.set(cache_key, note)
         
     return NoteResponse(**note)
 
@@ -103,15 +191,55 @@ async def update_note(
         return NoteResponse(**existing_note)
         
     update_data["updated_at"] = datetime.now(timezone.utc)
+    if "title" in update_data or "content" in update_data:
+        update_data["minhash"] = await compute_signature(
+            update_data.get("title", existing_note["title"]),
+            update_data.get("content", existing_note["content"]),
+        )
     
-    await db.get_db()["notes"].update_one(
-        {"_id": obj_id},
-        {"$set": update_data}
-    )
+    async with reserve_changes(current_user.id) as change_seq:
+        update_data["change_seq"] = change_seq
+        await db.get_db()["notes"].update_one(
+            {"_id": obj_id},
+            {"$set": update_data}
+        )
+    await note_cache.invalidate(current_user.id)
     
     updated_note = await db.get_db()["notes"].find_one({"_id": obj_id})
+    similarity_index.note_changed(current_user.id, updated_note)
     return NoteResponse(**updated_note)
 
+@router.get("/{note_id}/related", response_model=List[RelatedNote])
+async def related_notes(
+    note_id: str,
+    limit: int = Query(default=5, ge=1, le=50),
+    threshold: float = Query(default=0.1, ge=0.0, le=1.0),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    try:
+        obj_id = ObjectId(note_id)
+    except:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid note ID")
+
+    note = await db.get_db()["notes"].find_one({"_id": obj_id, "user_id": current_user.id}, {"_id": 1})
+    if not note:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Note not found")
+
+    index = await similarity_index.get(current_user.id)
+    matches = index.related(str(obj_id), limit, threshold)
+    if not matches:
+        return []
+
+    cursor = db.get_db()["notes"].find({
+        "_id": {"$in": [ObjectId(match_id) for match_id, _ in matches]},
+        "user_id": current_user.id
+    }, {"minhash": 0})
+    found = {str(n["_id"]): n async for n in cursor}
+    return [
+        RelatedNote(note=NoteResponse(**found[match_id]), score=score)
+        for match_id, score in matches if match_id in found
+    ]
+
 @router.delete("/{note_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_note(
     note_id: str,
@@ -128,13 +256,17 @@ async def delete_note(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Note not found")
 
     # Soft delete
-    await db.get_db()["notes"].update_one(
-        {"_id": obj_id},
-        {"$set": {
-            "is_archived": True,
-            "updated_at": datetime.now(timezone.utc)
-        }}
-    )
+    async with reserve_changes(current_user.id) as change_seq:
+        await db.get_db()["notes"].update_one(
+            {"_id": obj_id},
+            {"$set": {
+                "is_archived": True,
+                "updated_at": datetime.now(timezone.utc),
+                "change_seq": change_seq
+            }}
+        )
+    await note_cache.invalidate(current_user.id)
+    similarity_index.note_removed(current_user.id, str(obj_id))
     
     return None
 
@@ -153,15 +285,23 @@ async def restore_note(
     if not existing_note:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Note not found")
 
-    await db.get_db()["notes"].update_one(
-        {"_id": obj_id},
-        {"$set": {
-            "is_archived": False,
-            "updated_at": datetime.now(timezone.utc)
-        }}
-    )
+    restore_data = {
+        "is_archived": False,
+        "updated_at": datetime.now(timezone.utc)
+    }
+    if "minhash" not in existing_note:
+        restore_data["minhash"] = await compute_signature(existing_note["title"], existing_note["content"])
+
+    async with reserve_changes(current_user.id) as change_seq:
+        restore_data["change_seq"] = change_seq
+        await db.get_db()["notes"].update_one(
+            {"_id": obj_id},
+            {"$set": restore_data}
+        )
+    await note_cache.invalidate(current_user.id)
     
     updated_note = await db.get_db()["notes"].find_one({"_id": obj_id})
+    similarity_index.note_changed(current_user.id, updated_note)
     return NoteResponse(**updated_note)
 
 @router.delete("/{note_id}/permanent", status_code=status.HTTP_204_NO_CONTENT)
@@ -180,5 +320,9 @@ async def permanent_delete_note(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Note not found")
 
     await db.get_db()["notes"].delete_one({"_id": obj_id})
+    await note_cache.invalidate(current_user.id)
+    similarity_index.note_removed(current_user.id, str(obj_id))
+    await record_tombstones("note", current_user.id, [str(obj_id)])
+    await delete_note_attachments(current_user.id, [str(obj_id)])
     
     return None
\ No newline at end of file
@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+
+from database import db
+from models import NoteResponse, TagResponse, SyncResponse, UserInDB
+from auth_utils import get_current_user
+from sync_utils import backfill_change_seq, safe_change_seq
+
+router = APIRouter(prefix="/sync", tags=["sync"])
+
+@router.get("", response_model=SyncResponse)
+async def sync_changes(
+    since: str = Query(default="0"),
+    limit: int = Query(default=500, ge=1, le=5000),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    try:
+        since_seq = int(since)
+        if since_seq < 0:
+            raise ValueError
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid sync token")
+
+    await backfill_change_seq(current_user.id)
+    # Only serve changes below every write still in flight; a higher token could
+    # skip a lower sequence that commits later.
+    watermark = await safe_change_seq(current_user.id)
+
+    changes = []
+    for collection in ("notes", "tags", "tombstones"):
+        cursor = db.get_db()[collection].find(
+            {"user_id": current_user.id, "change_seq": {"$gt": since_seq, "$lte": watermark}},
+            {"minhash": 0}
+        ).sort("change_seq", 1).limit(limit + 1)
+        changes.extend((doc["change_seq"], collection, doc) async for doc in cursor)
+
+    # Each collection returned at most limit + 1 changes in order, so the first
+    # `limit` of the merge are exactly the next `limit` changes overall.
+    changes.sort(key=lambda change: change[0])
+    page = changes[:limit]
+
+    has_more = len(changes) > limit
+    response = SyncResponse(
+        token=str(page[-1][0] if has_more else max(since_seq, watermark)),
+        has_more=has_more,
+    )
+    for _, collection, doc in page:
+        if collection == "notes":
+            response.notes.append(NoteResponse(**doc))
+        elif collection == "tags":
+            response.tags.append(TagResponse(**doc))
+        elif doc["kind"] == "note":
+            response.deleted_notes.append(doc["entity_id"])
+        else:
+            response.deleted_tags.append(doc["entity_id"])
+    return response
@@ -6,6 +6,8 @@ from bson import ObjectId
 from database import db
 from models import TagCreate, TagResponse, UserInDB
 from auth_utils import get_current_user
+from cache import note_cache
+from sync_utils import reserve_changes, record_tombstones, stamp_changes
 
 router = APIRouter(prefix="/tags", tags=["tags"])
 
@@ -26,7 +28,9 @@ async def create_tag(
     tag_data["user_id"] = current_user.id
     tag_data["created_at"] = datetime.now(timezone.utc)
 
-    new_tag = await db.get_db()["tags"].insert_one(tag_data)
+    async with reserve_changes(current_user.id) as change_seq:
+        tag_data["change_seq"] = change_seq
+        new_tag = await db.get_db()["tags"].insert_one(tag_data)
     created_tag = await db.get_db()["tags"].find_one({"_id": new_tag.inserted_id})
     
     return TagResponse(**created_tag)
@@ -56,11 +60,16 @@ async def delete_tag(
 
     # Delete tag
     await db.get_db()["tags"].delete_one({"_id": obj_id})
+    await record_tombstones("tag", current_user.id, [str(obj_id)])
     
     # Remove this tag from any notes that use it (stored as name string in notes)
+    tagged_filter = {"user_id": current_user.id, "tags": existing_tag["name"]}
+    tagged_ids = [n["_id"] async for n in db.get_db()["notes"].find(tagged_filter, {"_id": 1})]
     await db.get_db()["notes"].update_many(
-        {"user_id": current_user.id, "tags": existing_tag["name"]},
+        tagged_filter,
         {"$pull": {"tags": existing_tag["name"]}}
     )
+    await stamp_changes("notes", current_user.id, tagged_ids)
+    await note_cache.invalidate(current_user.id)
 
     return None
\ No newline at end of file
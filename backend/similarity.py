@@ -0,0 +1,286 @@
+import re
+import zlib
+import asyncio
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from pymongo import UpdateOne
+
+from database import db, settings
+
+NUM_PERM = 128
+HASH_BLOCK = 4096
+# Rows per LSH band, from narrowest (fewest candidates) to widest; the narrowest
+# one that still finds LSH_RECALL of the pairs at the requested score is used.
+LSH_ROWS = (8, 4, 2)
+LSH_RECALL = 0.9
+MAX_BUCKET = 64
+LOAD_ATTEMPTS = 3
+
+_rng = np.random.default_rng(20240501)
+_PERM_A = _rng.integers(1, 2**63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, 2**63, size=NUM_PERM, dtype=np.uint64)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+_TOKEN_RE = re.compile(r"\w+")
+
+def _mix(words: np.ndarray) -> np.ndarray:
+    """Fold the last axis of a uint64 array into one hash per row."""
+    key = words[..., 0].copy()
+    for k in range(1, words.shape[-1]):
+        key = key * _MIX ^ words[..., k]
+    return key
+
+def lsh_rows(min_score: float) -> int:
+    """Rows per band such that a pair scoring `min_score` shares a band with probability >= LSH_RECALL."""
+    for rows in LSH_ROWS:
+        if 1 - (1 - min_score ** rows) ** (NUM_PERM // rows) >= LSH_RECALL:
+            return rows
+    return LSH_ROWS[-1]
+
+def shingles(title: str, content: str) -> set[str]:
+    words = _TOKEN_RE.findall(f"{title} {content}".lower())
+    grams = set(words)
+    grams.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return grams
+
+def minhash_signature(title: str, content: str) -> Optional[np.ndarray]:
+    grams = shingles(title, content)
+    if not grams:
+        return None
+    hashes = np.fromiter((zlib.crc32(g.encode()) for g in grams), dtype=np.uint64, count=len(grams))
+    signature = np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint64)
+    # Blocks keep the permutation matrix small even for very large notes.
+    for start in range(0, len(hashes), HASH_BLOCK):
+        block = hashes[start:start + HASH_BLOCK, None]
+        # Multiply-shift hashing: uint64 arithmetic wraps, the high 32 bits are the permuted value.
+        permuted = (block * _PERM_A + _PERM_B) >> np.uint64(32)
+        np.minimum(signature, permuted.min(axis=0), out=signature)
+    return signature.astype(np.uint32)
+
+def signature_bytes(title: str, content: str) -> Optional[bytes]:
+    signature = minhash_signature(title, content)
+    return None if signature is None else signature.tobytes()
+
+async def compute_signature(title: str, content: str) -> Optional[bytes]:
+    """Signature as stored on the note document, computed off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(None, signature_bytes, title, content)
+
+def _signatures_for(notes: list[dict]) -> list[Optional[bytes]]:
+    return [signature_bytes(note["title"], note["content"]) for note in notes]
+
+class UserSignatures:
+    """MinHash signatures for one user's active notes, stored row-wise in a growable matrix."""
+
+    def __init__(self, capacity: int = 64):
+        self.signatures = np.empty((capacity, NUM_PERM), dtype=np.uint32)
+        self.note_ids: list[str] = []
+        self.rows: dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.note_ids)
+
+    @property
+    def nbytes(self) -> int:
+        return self.signatures.nbytes
+
+    @classmethod
+    def from_rows(cls, note_ids: list[str], blobs: list[bytes]) -> "UserSignatures":
+        index = cls(capacity=max(len(note_ids), 64))
+        if note_ids:
+            index.signatures[:len(note_ids)] = np.frombuffer(b"".join(blobs), dtype=np.uint32).reshape(-1, NUM_PERM)
+        index.note_ids = list(note_ids)
+        index.rows = {note_id: row for row, note_id in enumerate(note_ids)}
+        return index
+
+    def upsert(self, note_id: str, signature: Optional[np.ndarray]):
+        if signature is None:
+            self.remove(note_id)
+            return
+        row = self.rows.get(note_id)
+        if row is None:
+            row = len(self.note_ids)
+            if row == self.signatures.shape[0]:
+                grown = np.empty((row * 2, NUM_PERM), dtype=np.uint32)
+                grown[:row] = self.signatures
+                self.signatures = grown
+            self.note_ids.append(note_id)
+            self.rows[note_id] = row
+        self.signatures[row] = signature
+
+    def remove(self, note_id: str):
+        row = self.rows.pop(note_id, None)
+        if row is None:
+            return
+        last = len(self.note_ids) - 1
+        if row != last:
+            moved = self.note_ids[last]
+            self.signatures[row] = self.signatures[last]
+            self.note_ids[row] = moved
+            self.rows[moved] = row
+        self.note_ids.pop()
+
+    def related(self, note_id: str, limit: int, min_score: float) -> list[tuple[str, float]]:
+        row = self.rows.get(note_id)
+        if row is None:
+            return []
+        n = len(self.note_ids)
+        scores = (self.signatures[:n] == self.signatures[row]).mean(axis=1)
+        scores[row] = -1.0
+        k = min(limit, n - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.note_ids[i], float(scores[i])) for i in top if scores[i] >= min_score]
+
+    def duplicates(self, limit: int, min_score: float) -> list[tuple[str, str, float]]:
+        n = len(self.note_ids)
+        if n < 2:
+            return []
+        sigs = self.signatures[:n]
+        words = sigs.view(np.uint64)
+
+        # Collapse identical signatures first so a pile of "Untitled" notes is one
+        # group of star pairs instead of a quadratic number of candidates.
+        _, first, inverse = np.unique(_mix(words), return_index=True, return_inverse=True)
+        rep = first[inverse.ravel()]
+        exact = np.flatnonzero(rep != np.arange(n))
+        same = (sigs[exact] == sigs[rep[exact]]).all(axis=1)
+        rep[exact[~same]] = exact[~same]
+        exact = exact[same]
+        exact = exact[np.lexsort((exact, rep[exact]))][:limit]
+        results = [(self.note_ids[rep[i]], self.note_ids[i], 1.0) for i in exact]
+        if len(results) >= limit:
+            return results
+
+        # LSH banding over the distinct signatures: rows that collide on any band
+        # become candidate pairs, verified against the full signature below.
+        reps = np.flatnonzero(rep == np.arange(n))
+        m = len(reps)
+        if m < 2:
+            return results
+        # Signature entries are uint32, so a band of `rows` entries is rows // 2 words.
+        rows = lsh_rows(min_score)
+        bands = NUM_PERM // rows
+        band_keys = np.ascontiguousarray(_mix(words[reps].reshape(m, bands, rows // 2)).T)
+        order = np.argsort(band_keys, axis=1)
+        candidates = []
+        for band in range(bands):
+            band_order = order[band]
+            keys = band_keys[band][band_order]
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            sizes = np.diff(np.r_[starts, m])
+            for start, size in zip(starts[sizes > 1], sizes[sizes > 1]):
+                members = np.sort(band_order[start:start + size])
+                if size > MAX_BUCKET:
+                    i, j = np.zeros(size - 1, dtype=np.int64), np.arange(1, size)
+                else:
+                    i, j = np.triu_indices(size, k=1)
+                candidates.append(members[i].astype(np.int64) * m + members[j])
+        if not candidates:
+            return results
+
+        pairs = np.unique(np.concatenate(candidates))
+        left, right = reps[pairs // m], reps[pairs % m]
+        scores = (sigs[left] == sigs[right]).mean(axis=1)
+        keep = scores >= min_score
+        left, right, scores = left[keep], right[keep], scores[keep]
+        order = np.argsort(-scores, kind="stable")[:limit - len(results)]
+        results.extend((self.note_ids[left[i]], self.note_ids[right[i]], float(scores[i])) for i in order)
+        return results
+
+class SimilarityIndex:
+    """Per-user signature cache, LRU-evicted by memory.
+
+    Signatures are stored on the note documents when notes are written, so a cold
+    load only reads them back; notes written before that are backfilled once, off
+    the event loop.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.users: OrderedDict[str, UserSignatures] = OrderedDict()
+        self.locks: dict[str, asyncio.Lock] = {}
+        # Bumped on every write, loaded or not, so a load that raced a write is detected.
+        self.generations: dict[str, int] = {}
+
+    async def get(self, user_id: str) -> UserSignatures:
+        index = self.users.get(user_id)
+        if index is not None:
+            self.users.move_to_end(user_id)
+            self.evict()
+            return index
+
+        lock = self.locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            index = self.users.get(user_id)
+            if index is not None:
+                return index
+            for _ in range(LOAD_ATTEMPTS):
+                generation = self.generations.get(user_id, 0)
+                index = await self.load(user_id)
+                if self.generations.get(user_id, 0) == generation:
+                    self.users[user_id] = index
+                    self.evict()
+                    break
+                # A note changed mid-load and the snapshot may have missed it; read again.
+        # Under a steady stream of writes, serve the last snapshot without caching it.
+        return index
+
+    async def load(self, user_id: str) -> UserSignatures:
+        notes = db.get_db()["notes"]
+        active = {"user_id": user_id, "is_archived": False}
+        note_ids, blobs, missing = [], [], []
+        async for note in notes.find(active, {"minhash": 1}):
+            if "minhash" not in note:
+                missing.append(note["_id"])
+            elif note["minhash"] is not None:
+                note_ids.append(str(note["_id"]))
+                blobs.append(note["minhash"])
+
+        if missing:
+            legacy = await notes.find(
+                {"_id": {"$in": missing}}, {"title": 1, "content": 1}
+            ).to_list(length=len(missing))
+            computed = await asyncio.get_running_loop().run_in_executor(None, _signatures_for, legacy)
+            if legacy:
+                await notes.bulk_write([
+                    UpdateOne({"_id": note["_id"]}, {"$set": {"minhash": blob}})
+                    for note, blob in zip(legacy, computed)
+                ], ordered=False)
+            for note, blob in zip(legacy, computed):
+                if blob is not None:
+                    note_ids.append(str(note["_id"]))
+                    blobs.append(blob)
+
+        return UserSignatures.from_rows(note_ids, blobs)
+
+    def evict(self):
+        total = sum(index.nbytes for index in self.users.values())
+        # The most recently used index always stays, even if it alone exceeds the budget.
+        while total > self.max_bytes and len(self.users) > 1:
+            evicted, index = self.users.popitem(last=False)
+            self.locks.pop(evicted, None)
+            total -= index.nbytes
+
+    def note_changed(self, user_id: str, note: dict):
+        self.generations[user_id] = self.generations.get(user_id, 0) + 1
+        index = self.users.get(user_id)
+        if index is None:
+            return
+        note_id = str(note["_id"])
+        if note.get("is_archived") or note.get("minhash") is None:
+            index.remove(note_id)
+        else:
+            index.upsert(note_id, np.frombuffer(note["minhash"], dtype=np.uint32))
+
+    def note_removed(self, user_id: str, note_id: str):
+        self.generations[user_id] = self.generations.get(user_id, 0) + 1
+        index = self.users.get(user_id)
+        if index is not None:
+            index.remove(note_id)
+
+similarity_index = SimilarityIndex(max_bytes=settings.SIMILARITY_CACHE_BYTES)
@@ -0,0 +1,97 @@
+import time
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# A reservation older than this is assumed to belong to a writer that died.
+PENDING_TIMEOUT_SECONDS = 30
+
+async def ensure_sync_indexes():
+    # Runs as a background task at startup; an unreachable database must not stop the app.
+    database = db.get_db()
+    try:
+        await database["notes"].create_index([("user_id", ASCENDING), ("change_seq", ASCENDING)])
+        await database["tags"].create_index([("user_id", ASCENDING), ("change_seq", ASCENDING)])
+        await database["tombstones"].create_index([("user_id", ASCENDING), ("change_seq", ASCENDING)])
+    except Exception as e:
+        logger.error(f"Could not create sync indexes: {e}")
+
+@asynccontextmanager
+async def reserve_changes(user_id: str, count: int = 1):
+    """Reserve `count` consecutive change sequence numbers and yield the first one.
+
+    The reservation stays pending until the block exits, so /sync never hands out
+    a token past a write that has not landed yet.
+    """
+    now = time.time()
+    # One atomic pipeline update: bump the counter, record the reserved range as
+    # pending, and drop reservations left behind by writers that died.
+    counter = await db.get_db()["sync_counters"].find_one_and_update(
+        {"_id": user_id},
+        [
+            {"$set": {"seq": {"$add": [{"$ifNull": ["$seq", 0]}, count]}}},
+            {"$set": {"pending": {"$concatArrays": [
+                {"$filter": {
+                    "input": {"$ifNull": ["$pending", []]},
+                    "cond": {"$gt": ["$$this.at", now - PENDING_TIMEOUT_SECONDS]},
+                }},
+                [{"seq": {"$subtract": ["$seq", count - 1]}, "at": now}],
+            ]}}},
+        ],
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    first = counter["seq"] - count + 1
+    try:
+        yield first
+    finally:
+        await db.get_db()["sync_counters"].update_one(
+            {"_id": user_id},
+            {"$pull": {"pending": {"seq": first}}},
+        )
+
+async def safe_change_seq(user_id: str) -> int:
+    """Highest sequence below which every reserved change has been written."""
+    counter = await db.get_db()["sync_counters"].find_one({"_id": user_id})
+    if not counter:
+        return 0
+    cutoff = time.time() - PENDING_TIMEOUT_SECONDS
+    pending = [p["seq"] for p in counter.get("pending", []) if p["at"] > cutoff]
+    return min(pending) - 1 if pending else counter["seq"]
+
+async def stamp_changes(collection: str, user_id: str, ids: list):
+    """Give each document its own sequence number so a page boundary never splits one."""
+    if not ids:
+        return
+    async with reserve_changes(user_id, len(ids)) as first:
+        await db.get_db()[collection].bulk_write([
+            UpdateOne({"_id": _id}, {"$set": {"change_seq": first + i}})
+            for i, _id in enumerate(ids)
+        ], ordered=False)
+
+async def record_tombstones(kind: str, user_id: str, entity_ids: list[str]):
+    if not entity_ids:
+        return
+    deleted_at = datetime.now(timezone.utc)
+    async with reserve_changes(user_id, len(entity_ids)) as first:
+        await db.get_db()["tombstones"].insert_many([
+            {
+                "user_id": user_id,
+                "kind": kind,
+                "entity_id": entity_id,
+                "change_seq": first + i,
+                "deleted_at": deleted_at,
+            }
+            for i, entity_id in enumerate(entity_ids)
+        ])
+
+async def backfill_change_seq(user_id: str):
+    # Documents written before change tracking existed have no sequence yet.
+    for collection in ("notes", "tags"):
+        cursor = db.get_db()[collection].find({"user_id": user_id, "change_seq": None}, {"_id": 1})
+        await stamp_changes(collection, user_id, [d["_id"] async for d in cursor])
@@ -0,0 +1,88 @@
+from datetime import datetime, timezone
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from auth_utils import get_current_user
+from models import UserInDB
+from routes import attachments
+
+NOTE_ID = str(ObjectId())
+FILE_ID = ObjectId()
+USER_ID = str(ObjectId())
+DATA = bytes(range(256)) * 2000  # spans several GridFS chunks
+
+class FakeGridOut:
+    """Mirrors MotorGridOut: `read` is a coroutine, `seek` and `close` are synchronous."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.position = 0
+        self.closed = False
+
+    def seek(self, position: int):
+        self.position = position
+
+    async def read(self, size: int) -> bytes:
+        chunk = self.data[self.position:self.position + size]
+        self.position += len(chunk)
+        return chunk
+
+    def close(self):
+        self.closed = True
+
+class FakeBucket:
+    def __init__(self, grid_out: FakeGridOut):
+        self.grid_out = grid_out
+
+    async def open_download_stream(self, file_id):
+        return self.grid_out
+
+@pytest.fixture
+def grid_out():
+    return FakeGridOut(DATA)
+
+@pytest.fixture
+def client(monkeypatch, grid_out):
+    async def get_owned_file(note_id, attachment_id, user_id):
+        return {
+            "_id": FILE_ID,
+            "filename": "photo.png",
+            "length": len(DATA),
+            "uploadDate": datetime(2024, 5, 1, tzinfo=timezone.utc),
+            "metadata": {"note_id": NOTE_ID, "user_id": USER_ID, "content_type": "image/png"},
+        }
+
+    monkeypatch.setattr(attachments, "get_owned_file", get_owned_file)
+    monkeypatch.setattr(attachments, "get_bucket", lambda: FakeBucket(grid_out))
+
+    app = FastAPI()
+    app.include_router(attachments.router)
+    app.dependency_overrides[get_current_user] = lambda: UserInDB(
+        _id=USER_ID, email="user@example.com", name="User", password_hash="x"
+    )
+    return TestClient(app)
+
+def test_download_streams_whole_file(client, grid_out):
+    resp = client.get(f"/notes/{NOTE_ID}/attachments/{FILE_ID}")
+
+    assert resp.status_code == 200
+    assert resp.content == DATA
+    assert resp.headers["content-length"] == str(len(DATA))
+    assert resp.headers["x-content-type-options"] == "nosniff"
+    assert grid_out.closed
+
+def test_download_range(client, grid_out):
+    resp = client.get(f"/notes/{NOTE_ID}/attachments/{FILE_ID}", headers={"Range": "bytes=1000-299999"})
+
+    assert resp.status_code == 206
+    assert resp.content == DATA[1000:300000]
+    assert resp.headers["content-range"] == f"bytes 1000-299999/{len(DATA)}"
+    assert grid_out.closed
+
+def test_download_not_modified(client):
+    resp = client.get(f"/notes/{NOTE_ID}/attachments/{FILE_ID}", headers={"If-None-Match": f'"{FILE_ID}"'})
+
+    assert resp.status_code == 304